@@ -1,14 +1,77 @@
 import os
+import re
+import sys
 import json
 import uuid
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass, asdict
+import atexit
+import asyncio
+import itertools
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Any, Set
+from dataclasses import dataclass, field
 import folder_paths
 from server import PromptServer
 from aiohttp import web
 
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    orjson = None
+    _loads = json.loads
 
-@dataclass
+
+def _load_json_file(raw: bytes) -> Any:
+    """Parse one of our data files.
+
+    The files are written by stdlib json, which allows NaN and Infinity. orjson
+    rejects those, so fall back to stdlib json rather than losing the file.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(raw)
+
+
+def _dumps(data: Any) -> bytes:
+    """Encode data as JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data)
+        except orjson.JSONEncodeError:
+            # orjson rejects values stdlib json accepts, e.g. lone surrogates
+            # and integers wider than 64 bits, which clients can store in notes
+            pass
+    return json.dumps(data).encode('utf-8')
+
+
+def _json_response(data: Any, status: int = 200) -> web.Response:
+    return web.Response(body=_dumps(data), status=status, content_type="application/json")
+
+
+# Signature of a compiled trigger condition:
+# (selected_node_type, selected_node_attributes, workflow_name, workflow_nodes) -> bool
+Matcher = Callable[[Optional[str], Optional[Dict[str, Any]], Optional[str], Optional[Dict[str, Any]]], bool]
+
+
+def _never_matches(selected_node_type, selected_node_attributes, workflow_name, workflow_nodes) -> bool:
+    return False
+
+
+# Fields accepted from clients for a trigger condition; all but "type" are optional
+_TC_FIELDS = ("type", "node_types", "node_type", "attribute_name", "attribute_values", "workflow_names")
+_TC_LIST_FIELDS = ("node_types", "attribute_values", "workflow_names")
+_TC_STR_FIELDS = ("type", "node_type", "attribute_name")
+
+
+def _compile_substring_pattern(values: List[str]) -> "re.Pattern[str]":
+    """Compile a pattern that finds any of values as a substring."""
+    return re.compile("|".join(re.escape(str(val)) for val in values))
+
+
+@dataclass(slots=True)
 class TriggerCondition:
     type: str  # "node_selected", "node_selected_attribute", "node_in_workflow", "node_in_workflow_attribute", "workflow_name"
     node_types: Optional[List[str]] = None
@@ -17,8 +80,108 @@ class TriggerCondition:
     attribute_values: Optional[List[str]] = None
     workflow_names: Optional[List[str]] = None
 
+    def to_json_dict(self) -> Dict[str, Any]:
+        return {
+            "type": self.type,
+            "node_types": self.node_types,
+            "node_type": self.node_type,
+            "attribute_name": self.attribute_name,
+            "attribute_values": self.attribute_values,
+            "workflow_names": self.workflow_names,
+        }
 
-@dataclass
+    @classmethod
+    def from_untrusted(cls, data: Any) -> "TriggerCondition":
+        """Build a condition from client JSON, raising ValueError if it is malformed."""
+        if not isinstance(data, dict):
+            raise ValueError("Trigger condition must be an object")
+        unknown = data.keys() - set(_TC_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown trigger condition fields: {', '.join(sorted(unknown))}")
+        if not isinstance(data.get("type"), str):
+            raise ValueError("Trigger condition 'type' must be a string")
+        for name in _TC_STR_FIELDS:
+            value = data.get(name)
+            if value is not None and not isinstance(value, str):
+                raise ValueError(f"Trigger condition '{name}' must be a string")
+        for name in _TC_LIST_FIELDS:
+            value = data.get(name)
+            if value is not None and not (isinstance(value, list) and all(isinstance(v, str) for v in value)):
+                raise ValueError(f"Trigger condition '{name}' must be a list of strings")
+
+        # Fields are already validated, so skip the generated __init__
+        condition = cls.__new__(cls)
+        for name in _TC_FIELDS:
+            object.__setattr__(condition, name, data.get(name))
+        return condition
+
+    def build_matcher(self) -> Matcher:
+        """Compile this condition into a function of the current selection and workflow."""
+        node_types = self.node_types
+        node_type = self.node_type
+        attribute_name = self.attribute_name
+        attribute_values = self.attribute_values
+        workflow_names = self.workflow_names
+
+        if self.type == "node_selected":
+            if node_types is None:
+                return _never_matches
+
+            def match(selected_node_type, selected_node_attributes, workflow_name, workflow_nodes):
+                return selected_node_type is not None and selected_node_type in node_types
+            return match
+
+        if self.type == "node_selected_attribute":
+            if not attribute_values:
+                return _never_matches
+            search = _compile_substring_pattern(attribute_values).search
+
+            def match(selected_node_type, selected_node_attributes, workflow_name, workflow_nodes):
+                if (selected_node_type != node_type or
+                    selected_node_attributes is None or
+                    attribute_name not in selected_node_attributes):
+                    return False
+                return search(str(selected_node_attributes[attribute_name])) is not None
+            return match
+
+        if self.type == "node_in_workflow":
+            if node_types is None:
+                return _never_matches
+
+            def match(selected_node_type, selected_node_attributes, workflow_name, workflow_nodes):
+                # Check if any of the specified node types exist in the workflow
+                return workflow_nodes is not None and any(nt in workflow_nodes for nt in node_types)
+            return match
+
+        if self.type == "node_in_workflow_attribute":
+            if node_type is None or attribute_name is None:
+                return _never_matches
+            # Without attribute_values, presence of the attribute is enough
+            search = _compile_substring_pattern(attribute_values).search if attribute_values else None
+
+            def match(selected_node_type, selected_node_attributes, workflow_name, workflow_nodes):
+                if workflow_nodes is None or node_type not in workflow_nodes:
+                    return False
+                node_attrs = workflow_nodes[node_type]
+                if attribute_name not in node_attrs:
+                    return False
+                if search is None:
+                    return True
+                return search(str(node_attrs[attribute_name])) is not None
+            return match
+
+        if self.type == "workflow_name":
+            if workflow_names is None:
+                return _never_matches
+
+            def match(selected_node_type, selected_node_attributes, workflow_name, workflow_nodes):
+                return workflow_name is not None and any(name in workflow_name for name in workflow_names)
+            return match
+
+        return _never_matches
+
+
+@dataclass(slots=True)
 class Note:
     uuid: str
     folder_uuid: Optional[str]
@@ -28,51 +191,214 @@ class Note:
     pinned: bool = False
     name: str = ""
     tags: List[str] = None
+    _compiled_matchers: List[Matcher] = field(default=None, init=False, repr=False, compare=False)
 
     def __post_init__(self):
         if self.tags is None:
             self.tags = []
+        self.compile_matchers()
+
+    def compile_matchers(self):
+        """Rebuild the matchers; call after replacing trigger_conditions."""
+        self._compiled_matchers = [tc.build_matcher() for tc in self.trigger_conditions]
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        """Build a JSON-serializable dict without the deep copy done by asdict()."""
+        return {
+            "uuid": self.uuid,
+            "folder_uuid": self.folder_uuid,
+            "content": self.content,
+            "format_style": self.format_style,
+            "trigger_conditions": [tc.to_json_dict() for tc in self.trigger_conditions],
+            "pinned": self.pinned,
+            "name": self.name,
+            "tags": self.tags,
+        }
 
 
-@dataclass
+# Note attributes that update_note may assign; uuid and private fields are never editable
+_NOTE_EDITABLE_FIELDS = frozenset(("folder_uuid", "content", "format_style", "trigger_conditions", "pinned", "name", "tags"))
+
+
+@dataclass(slots=True)
 class Folder:
     uuid: str
     parent_uuid: Optional[str]
     name: str
 
+    def to_json_dict(self) -> Dict[str, Any]:
+        return {
+            "uuid": self.uuid,
+            "parent_uuid": self.parent_uuid,
+            "name": self.name,
+        }
+
+
+# ComfyUI sets its user directory before custom nodes are imported
+_USER_DIR = folder_paths.get_user_directory()
+
+# Data directories already created in this process
+_DIRS_ENSURED: Set[str] = set()
+
+# Seconds to wait before writing notes.json, so bursts of edits coalesce
+NOTES_FLUSH_DELAY = 0.25
+
+# File writes run off the event loop. A single worker keeps writes to the
+# same file in submission order and avoids clobbering each other's temp file.
+_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="autonotes-writer")
+
+
+def _submit_write(write: Callable[[bytes], None], payload: bytes, wait: bool = False) -> Optional[Future]:
+    """Run write(payload) on the writer thread, optionally blocking until done."""
+    try:
+        future = _WRITER.submit(write, payload)
+    except RuntimeError:
+        # The writer is already shut down at interpreter exit, and all queued
+        # writes have completed, so writing inline keeps the order intact
+        write(payload)
+        return None
+    if wait:
+        future.result()
+    return future
+
+
+def _is_pending(future: Optional[Future]) -> bool:
+    return future is not None and not future.done()
+
 
 class AutoNotesManager:
     def __init__(self, user: str = "default"):
         self.user = user
-        self.user_dir = folder_paths.get_user_directory()
+        self.user_dir = _USER_DIR
         # Store data in user-specific subdirectory (e.g., user/default/autonotes)
         self.data_dir = os.path.join(self.user_dir, user, "autonotes")
         self.notes_file = os.path.join(self.data_dir, "notes.json")
         self.folders_file = os.path.join(self.data_dir, "folders.json")
 
         # Ensure data directory exists
-        os.makedirs(self.data_dir, exist_ok=True)
+        if self.data_dir not in _DIRS_ENSURED:
+            os.makedirs(self.data_dir, exist_ok=True)
+            _DIRS_ENSURED.add(self.data_dir)
 
         # Load existing data
         self.notes: Dict[str, Note] = self._load_notes()
         self.folders: Dict[str, Folder] = self._load_folders()
+        self._rebuild_indexes()
+
+        # Modification times of the files as last seen by this manager
+        self._notes_mtime = self._get_mtime(self.notes_file)
+        self._folders_mtime = self._get_mtime(self.folders_file)
+
+        # Pending coalesced write of notes.json, see _schedule_flush_notes
+        self._dirty_notes = False
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+        # Most recently submitted background writes
+        self._notes_write: Optional[Future] = None
+        self._folders_write: Optional[Future] = None
+
+    @staticmethod
+    def _get_mtime(path: str) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def refresh_if_changed(self):
+        """Reload notes/folders if they were modified outside this manager."""
+        notes_mtime = self._get_mtime(self.notes_file)
+        # Unflushed or in-flight in-memory edits take precedence over the file on disk
+        if (notes_mtime != self._notes_mtime and not self._dirty_notes and
+            not _is_pending(self._notes_write)):
+            self.notes = self._load_notes()
+            self._rebuild_indexes()
+            self._notes_mtime = notes_mtime
+
+        folders_mtime = self._get_mtime(self.folders_file)
+        if folders_mtime != self._folders_mtime and not _is_pending(self._folders_write):
+            self.folders = self._load_folders()
+            self._folders_mtime = folders_mtime
+
+    def _rebuild_indexes(self):
+        """Build the trigger-condition lookup indexes from self.notes."""
+        # Selected node type -> uuids of notes with node_selected(_attribute) conditions
+        self._idx_node_selected: Dict[Optional[str], Set[str]] = {}
+        # Workflow node type -> uuids of notes with node_in_workflow(_attribute) conditions
+        self._idx_node_in_workflow: Dict[str, Set[str]] = {}
+        # Workflow name substring -> uuids of notes with workflow_name conditions
+        self._idx_workflow: Dict[str, Set[str]] = {}
+        self._pinned: Set[str] = set()
+        # Folder uuid -> uuids of the notes it contains
+        self._notes_by_folder: Dict[Optional[str], Set[str]] = {}
+        # Insertion order of notes, so filtered results keep the order of self.notes
+        self._note_order: Dict[str, int] = {}
+        self._order_counter = itertools.count()
+        # Encoded response for mode=all, reset whenever notes change
+        self._all_notes_cache: Optional[bytes] = None
+
+        for note in self.notes.values():
+            self._index_note(note)
+
+    def _condition_index_keys(self, condition: TriggerCondition):
+        """Yield (index, key) pairs under which a condition can match."""
+        if condition.type == "node_selected":
+            for node_type in condition.node_types or ():
+                yield self._idx_node_selected, node_type
+        elif condition.type == "node_selected_attribute":
+            # node_type may be None, which matches when no node is selected
+            yield self._idx_node_selected, condition.node_type
+        elif condition.type == "node_in_workflow":
+            for node_type in condition.node_types or ():
+                yield self._idx_node_in_workflow, node_type
+        elif condition.type == "node_in_workflow_attribute":
+            if condition.node_type is not None:
+                yield self._idx_node_in_workflow, condition.node_type
+        elif condition.type == "workflow_name":
+            for name in condition.workflow_names or ():
+                yield self._idx_workflow, name
+
+    def _index_note(self, note: Note):
+        if note.uuid not in self._note_order:
+            self._note_order[note.uuid] = next(self._order_counter)
+        if note.pinned:
+            self._pinned.add(note.uuid)
+        self._notes_by_folder.setdefault(note.folder_uuid, set()).add(note.uuid)
+        for condition in note.trigger_conditions:
+            for index, key in self._condition_index_keys(condition):
+                index.setdefault(key, set()).add(note.uuid)
+
+    def _unindex_note(self, note: Note):
+        self._pinned.discard(note.uuid)
+        members = self._notes_by_folder.get(note.folder_uuid)
+        if members is not None:
+            members.discard(note.uuid)
+            if not members:
+                del self._notes_by_folder[note.folder_uuid]
+        for condition in note.trigger_conditions:
+            for index, key in self._condition_index_keys(condition):
+                uuids = index.get(key)
+                if uuids is not None:
+                    uuids.discard(note.uuid)
+                    if not uuids:
+                        del index[key]
 
     def _load_notes(self) -> Dict[str, Note]:
         if os.path.exists(self.notes_file):
             try:
-                with open(self.notes_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    notes = {}
-                    for note_data in data:
-                        # Convert trigger conditions
-                        trigger_conditions = []
-                        for tc_data in note_data.get('trigger_conditions', []):
-                            trigger_conditions.append(TriggerCondition(**tc_data))
-
-                        note_data['trigger_conditions'] = trigger_conditions
-                        note = Note(**note_data)
-                        notes[note.uuid] = note
-                    return notes
+                with open(self.notes_file, 'rb') as f:
+                    raw = f.read()
+                data = _load_json_file(raw)
+                notes = {}
+                for note_data in data:
+                    # Convert trigger conditions
+                    trigger_conditions = []
+                    for tc_data in note_data.get('trigger_conditions', []):
+                        trigger_conditions.append(TriggerCondition(**tc_data))
+
+                    note_data['trigger_conditions'] = trigger_conditions
+                    note = Note(**note_data)
+                    notes[note.uuid] = note
+                return notes
             except Exception as e:
                 print(f"AutoNotes: Error loading notes: {e}")
         return {}
@@ -80,40 +406,115 @@ class AutoNotesManager:
     def _load_folders(self) -> Dict[str, Folder]:
         if os.path.exists(self.folders_file):
             try:
-                with open(self.folders_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    folders = {}
-                    for folder_data in data:
-                        folder = Folder(**folder_data)
-                        folders[folder.uuid] = folder
-                    return folders
+                with open(self.folders_file, 'rb') as f:
+                    raw = f.read()
+                data = _load_json_file(raw)
+                folders = {}
+                for folder_data in data:
+                    folder = Folder(**folder_data)
+                    folders[folder.uuid] = folder
+                return folders
             except Exception as e:
                 print(f"AutoNotes: Error loading folders: {e}")
         return {}
 
-    def _save_notes(self):
+    @staticmethod
+    def _write_atomic(path: str, payload: bytes):
+        """Replace path with payload without ever exposing a partial file.
+
+        No fsync: a crash may lose the latest edit, but never corrupts the file.
+        """
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _write_notes_file(self, payload: bytes):
+        try:
+            self._write_atomic(self.notes_file, payload)
+            self._notes_mtime = self._get_mtime(self.notes_file)
+        except Exception as e:
+            print(f"AutoNotes: Error saving notes: {e}")
+
+    def _write_folders_file(self, payload: bytes):
+        try:
+            self._write_atomic(self.folders_file, payload)
+            self._folders_mtime = self._get_mtime(self.folders_file)
+        except Exception as e:
+            print(f"AutoNotes: Error saving folders: {e}")
+
+    @staticmethod
+    def _encode_data_file(data: Any) -> bytes:
         try:
-            data = []
-            for note in self.notes.values():
-                note_dict = asdict(note)
-                # Convert trigger conditions to dict
-                note_dict['trigger_conditions'] = [asdict(tc) for tc in note.trigger_conditions]
-                data.append(note_dict)
-
-            with open(self.notes_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+        except UnicodeEncodeError:
+            # Lone surrogates from client JSON can't be encoded as UTF-8; escape them instead
+            return json.dumps(data, indent=2).encode('utf-8')
+
+    def _save_notes(self, wait: bool = False):
+        # Encode on the calling thread, so the writer never sees self.notes mid-update.
+        # Encoding up front also means a serialization error never truncates the file.
+        try:
+            data = [note.to_json_dict() for note in self.notes.values()]
+            payload = self._encode_data_file(data)
         except Exception as e:
             print(f"AutoNotes: Error saving notes: {e}")
+            return
+        self._notes_write = _submit_write(self._write_notes_file, payload, wait)
 
-    def _save_folders(self):
+    def _save_folders(self, wait: bool = False):
         try:
-            data = [asdict(folder) for folder in self.folders.values()]
-            with open(self.folders_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            data = [folder.to_json_dict() for folder in self.folders.values()]
+            payload = self._encode_data_file(data)
         except Exception as e:
             print(f"AutoNotes: Error saving folders: {e}")
+            return
+        self._folders_write = _submit_write(self._write_folders_file, payload, wait)
+
+    def _schedule_flush_notes(self):
+        """Mark notes as dirty and write them out after a short delay.
+
+        Bursts of edits (e.g. typing in the editor) within the delay window
+        result in a single write of notes.json.
+        """
+        self._dirty_notes = True
+        if self._flush_handle is not None:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Not called from the event loop, write immediately
+            self.flush_notes()
+            return
+
+        self._flush_handle = loop.call_later(NOTES_FLUSH_DELAY, self.flush_notes)
+
+    def flush_notes(self, wait: bool = False):
+        """Write notes.json now if there are unsaved changes."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        if self._dirty_notes:
+            self._dirty_notes = False
+            self._save_notes(wait)
+
+    @staticmethod
+    def _check_folder_uuid(folder_uuid: Any):
+        # Used as an index key, so it must be hashable; clients may only send a string or null
+        if folder_uuid is not None and not isinstance(folder_uuid, str):
+            raise ValueError("'folder_uuid' must be a string or null")
 
     def create_note(self, name: str, folder_uuid: Optional[str] = None) -> str:
+        self._check_folder_uuid(folder_uuid)
         note_uuid = str(uuid.uuid4())
         note = Note(
             uuid=note_uuid,
@@ -124,25 +525,45 @@ class AutoNotesManager:
             name=name
         )
         self.notes[note_uuid] = note
-        self._save_notes()
+        self._index_note(note)
+        self._all_notes_cache = None
+        self._schedule_flush_notes()
         return note_uuid
 
     def update_note(self, note_uuid: str, **kwargs) -> bool:
         if note_uuid not in self.notes:
             return False
 
-        note = self.notes[note_uuid]
-        for key, value in kwargs.items():
-            if hasattr(note, key):
-                setattr(note, key, value)
+        # Ignore anything that isn't an editable field
+        updates = {key: value for key, value in kwargs.items() if key in _NOTE_EDITABLE_FIELDS}
+
+        # Validate indexed fields before unindexing, so a bad value can't leave the note half-indexed
+        folder_uuid = updates.get('folder_uuid')
+        self._check_folder_uuid(folder_uuid)
+        if 'trigger_conditions' in updates:
+            trigger_conditions = updates['trigger_conditions']
+            if not (isinstance(trigger_conditions, list) and
+                    all(isinstance(tc, TriggerCondition) for tc in trigger_conditions)):
+                raise ValueError("'trigger_conditions' must be a list of TriggerCondition")
 
-        self._save_notes()
+        note = self.notes[note_uuid]
+        self._unindex_note(note)
+        for key, value in updates.items():
+            setattr(note, key, value)
+        if 'trigger_conditions' in updates:
+            note.compile_matchers()
+        self._index_note(note)
+        self._all_notes_cache = None
+
+        self._schedule_flush_notes()
         return True
 
     def delete_note(self, note_uuid: str) -> bool:
         if note_uuid in self.notes:
-            del self.notes[note_uuid]
-            self._save_notes()
+            self._unindex_note(self.notes.pop(note_uuid))
+            del self._note_order[note_uuid]
+            self._all_notes_cache = None
+            self._schedule_flush_notes()
             return True
         return False
 
@@ -157,6 +578,12 @@ class AutoNotesManager:
         self._save_folders()
         return folder_uuid
 
+    def get_all_notes_json(self) -> bytes:
+        """Return all notes encoded as JSON, cached until the notes change."""
+        if self._all_notes_cache is None:
+            self._all_notes_cache = _dumps([note.to_json_dict() for note in self.notes.values()])
+        return self._all_notes_cache
+
     def get_notes_for_display(self, mode: str = "all", selected_node_type: Optional[str] = None,
                             selected_node_attributes: Optional[Dict[str, Any]] = None,
                             workflow_name: Optional[str] = None,
@@ -164,91 +591,81 @@ class AutoNotesManager:
         if mode == "all":
             return list(self.notes.values())
 
-        # Automatic mode - filter by trigger conditions
-        matching_notes = []
+        # Nothing selected and no workflow context: no condition can match
+        if (selected_node_type is None and not selected_node_attributes and
+            workflow_name is None and not workflow_nodes):
+            return [self.notes[note_uuid] for note_uuid in sorted(self._pinned, key=self._note_order.__getitem__)]
+
+        # Automatic mode - shortlist notes via the indexes, then check their conditions
+        candidates = set(self._pinned)
+        candidates.update(self._idx_node_selected.get(selected_node_type, ()))
+        if workflow_nodes:
+            # Probe with whichever side has fewer node types
+            if isinstance(workflow_nodes, dict) and len(workflow_nodes) < len(self._idx_node_in_workflow):
+                for node_type in workflow_nodes:
+                    candidates.update(self._idx_node_in_workflow.get(node_type, ()))
+            else:
+                for node_type, uuids in self._idx_node_in_workflow.items():
+                    if node_type in workflow_nodes:
+                        candidates.update(uuids)
+        if workflow_name is not None:
+            for name, uuids in self._idx_workflow.items():
+                if name in workflow_name:
+                    candidates.update(uuids)
 
-        for note in self.notes.values():
+        matching_notes = []
+        for note_uuid in sorted(candidates, key=self._note_order.__getitem__):
+            note = self.notes[note_uuid]
             if note.pinned:
                 matching_notes.append(note)
                 continue
 
-            for condition in note.trigger_conditions:
-                if self._check_trigger_condition(condition, selected_node_type,
-                                               selected_node_attributes, workflow_name,
-                                               workflow_nodes):
-                    matching_notes.append(note)
-                    break
+            if any(match(selected_node_type, selected_node_attributes, workflow_name, workflow_nodes)
+                   for match in note._compiled_matchers):
+                matching_notes.append(note)
 
         return matching_notes
 
-    def _check_trigger_condition(self, condition: TriggerCondition,
-                               selected_node_type: Optional[str],
-                               selected_node_attributes: Optional[Dict[str, Any]],
-                               workflow_name: Optional[str],
-                               workflow_nodes: Optional[Dict[str, Any]] = None) -> bool:
-        if condition.type == "node_selected":
-            return (selected_node_type is not None and
-                   condition.node_types is not None and
-                   selected_node_type in condition.node_types)
-
-        elif condition.type == "node_selected_attribute":
-            if (selected_node_type == condition.node_type and
-                selected_node_attributes is not None and
-                condition.attribute_name in selected_node_attributes and
-                condition.attribute_values is not None):
-
-                attr_value = str(selected_node_attributes[condition.attribute_name])
-                return any(val in attr_value for val in condition.attribute_values)
-
-        elif condition.type == "node_in_workflow":
-            if workflow_nodes is not None and condition.node_types is not None:
-                # Check if any of the specified node types exist in the workflow
-                return any(node_type in workflow_nodes for node_type in condition.node_types)
-
-        elif condition.type == "node_in_workflow_attribute":
-            if (workflow_nodes is not None and
-                condition.node_type is not None and
-                condition.attribute_name is not None):
-
-                # Check if the node type exists and has the specified attribute
-                if condition.node_type in workflow_nodes:
-                    node_attrs = workflow_nodes[condition.node_type]
-                    if condition.attribute_name in node_attrs:
-                        # If attribute_values is specified, check if any match
-                        if condition.attribute_values is not None and len(condition.attribute_values) > 0:
-                            attr_value = str(node_attrs[condition.attribute_name])
-                            return any(val in attr_value for val in condition.attribute_values)
-                        else:
-                            # No specific values required, just presence is enough
-                            return True
-
-        elif condition.type == "workflow_name":
-            if workflow_name is not None and condition.workflow_names is not None:
-                return any(name in workflow_name for name in condition.workflow_names)
 
-        return False
+# Per-user manager instances, created lazily on first request
+_MANAGERS: Dict[str, AutoNotesManager] = {}
 
 
-# Global manager instance
 # Helper function to get user from request
 def get_user_from_request(request) -> str:
     """Get the user ID from the request headers, defaulting to 'default'."""
-    user = "default"
-    if "comfy-user" in request.headers:
-        user = request.headers["comfy-user"]
-
-    # If user is empty or None, use "default"
-    if not user:
-        user = "default"
+    # If user is missing or empty, use "default"
+    user = request.headers.get("comfy-user") or "default"
 
-    return user
+    # Interned, so manager lookups usually compare by identity
+    return sys.intern(user)
 
 
 # Helper function to get manager for request
 def get_manager_for_request(request) -> AutoNotesManager:
     """Get a user-specific AutoNotesManager instance based on the request."""
     user = get_user_from_request(request)
-    return AutoNotesManager(user)
+    manager = _MANAGERS.get(user)
+    if manager is None:
+        manager = AutoNotesManager(user)
+        _MANAGERS[user] = manager
+    else:
+        manager.refresh_if_changed()
+    return manager
+
+
+def flush_all_managers():
+    """Write out any pending note changes for all users and wait for them."""
+    for manager in _MANAGERS.values():
+        manager.flush_notes(wait=True)
+
+
+async def _flush_on_shutdown(app):
+    flush_all_managers()
+
+
+atexit.register(flush_all_managers)
+PromptServer.instance.app.on_shutdown.append(_flush_on_shutdown)
 
 
 class AutoNotesNode:
@@ -275,22 +692,27 @@ async def get_notes(request):
     try:
         manager = get_manager_for_request(request)
         mode = request.query.get('mode', 'all')
+        if mode == "all":
+            return web.Response(body=manager.get_all_notes_json(), content_type="application/json")
+
         selected_node_type = request.query.get('node_type')
         workflow_name = request.query.get('workflow_name')
 
         # Parse node attributes if provided
         selected_node_attributes = None
-        if 'node_attributes' in request.query:
+        node_attributes = request.query.get('node_attributes')
+        if node_attributes:
             try:
-                selected_node_attributes = json.loads(request.query['node_attributes'])
+                selected_node_attributes = _loads(node_attributes)
             except:
                 pass
 
         # Parse workflow nodes if provided
         workflow_nodes = None
-        if 'workflow_nodes' in request.query:
+        workflow_nodes_param = request.query.get('workflow_nodes')
+        if workflow_nodes_param:
             try:
-                workflow_nodes = json.loads(request.query['workflow_nodes'])
+                workflow_nodes = _loads(workflow_nodes_param)
             except:
                 pass
 
@@ -303,15 +725,11 @@ async def get_notes(request):
         )
 
         # Convert notes to JSON-serializable format
-        notes_data = []
-        for note in notes:
-            note_dict = asdict(note)
-            note_dict['trigger_conditions'] = [asdict(tc) for tc in note.trigger_conditions]
-            notes_data.append(note_dict)
+        notes_data = [note.to_json_dict() for note in notes]
 
-        return web.json_response(notes_data)
+        return _json_response(notes_data)
     except Exception as e:
-        return web.json_response({"error": str(e)}, status=500)
+        return _json_response({"error": str(e)}, status=500)
 
 
 @PromptServer.instance.routes.post("/autonotes/notes")
@@ -322,10 +740,13 @@ async def create_note(request):
         name = data.get('name', 'New Note')
         folder_uuid = data.get('folder_uuid')
 
-        note_uuid = manager.create_note(name, folder_uuid)
-        return web.json_response({"uuid": note_uuid})
+        try:
+            note_uuid = manager.create_note(name, folder_uuid)
+        except ValueError as e:
+            return _json_response({"error": str(e)}, status=400)
+        return _json_response({"uuid": note_uuid})
     except Exception as e:
-        return web.json_response({"error": str(e)}, status=500)
+        return _json_response({"error": str(e)}, status=500)
 
 
 @PromptServer.instance.routes.put("/autonotes/notes/{note_uuid}")
@@ -335,17 +756,20 @@ async def update_note(request):
         note_uuid = request.match_info['note_uuid']
         data = await request.json()
 
-        # Handle trigger conditions conversion
-        if 'trigger_conditions' in data:
-            trigger_conditions = []
-            for tc_data in data['trigger_conditions']:
-                trigger_conditions.append(TriggerCondition(**tc_data))
-            data['trigger_conditions'] = trigger_conditions
-
-        success = manager.update_note(note_uuid, **data)
-        return web.json_response({"success": success})
+        try:
+            # Handle trigger conditions conversion
+            if 'trigger_conditions' in data:
+                if not isinstance(data['trigger_conditions'], list):
+                    raise ValueError("'trigger_conditions' must be a list")
+                data['trigger_conditions'] = [TriggerCondition.from_untrusted(tc_data)
+                                              for tc_data in data['trigger_conditions']]
+
+            success = manager.update_note(note_uuid, **data)
+        except ValueError as e:
+            return _json_response({"success": False, "error": str(e)}, status=400)
+        return _json_response({"success": success})
     except Exception as e:
-        return web.json_response({"error": str(e)}, status=500)
+        return _json_response({"error": str(e)}, status=500)
 
 
 @PromptServer.instance.routes.delete("/autonotes/notes/{note_uuid}")
@@ -354,19 +778,19 @@ async def delete_note(request):
         manager = get_manager_for_request(request)
         note_uuid = request.match_info['note_uuid']
         success = manager.delete_note(note_uuid)
-        return web.json_response({"success": success})
+        return _json_response({"success": success})
     except Exception as e:
-        return web.json_response({"error": str(e)}, status=500)
+        return _json_response({"error": str(e)}, status=500)
 
 
 @PromptServer.instance.routes.get("/autonotes/folders")
 async def get_folders(request):
     try:
         manager = get_manager_for_request(request)
-        folders_data = [asdict(folder) for folder in manager.folders.values()]
-        return web.json_response(folders_data)
+        folders_data = [folder.to_json_dict() for folder in manager.folders.values()]
+        return _json_response(folders_data)
     except Exception as e:
-        return web.json_response({"error": str(e)}, status=500)
+        return _json_response({"error": str(e)}, status=500)
 
 
 @PromptServer.instance.routes.post("/autonotes/folders")
@@ -378,9 +802,9 @@ async def create_folder(request):
         parent_uuid = data.get('parent_uuid')
 
         folder_uuid = manager.create_folder(name, parent_uuid)
-        return web.json_response({"uuid": folder_uuid})
+        return _json_response({"uuid": folder_uuid})
     except Exception as e:
-        return web.json_response({"error": str(e)}, status=500)
+        return _json_response({"error": str(e)}, status=500)
 
 
 @PromptServer.instance.routes.put("/autonotes/folders/{folder_uuid}")
@@ -391,7 +815,7 @@ async def update_folder(request):
         data = await request.json()
 
         if folder_uuid not in manager.folders:
-            return web.json_response({"success": False, "error": "Folder not found"}, status=404)
+            return _json_response({"success": False, "error": "Folder not found"}, status=404)
 
         folder = manager.folders[folder_uuid]
         if 'name' in data:
@@ -400,9 +824,9 @@ async def update_folder(request):
             folder.parent_uuid = data['parent_uuid']
 
         manager._save_folders()
-        return web.json_response({"success": True})
+        return _json_response({"success": True})
     except Exception as e:
-        return web.json_response({"error": str(e)}, status=500)
+        return _json_response({"error": str(e)}, status=500)
 
 
 @PromptServer.instance.routes.delete("/autonotes/folders/{folder_uuid}")
@@ -412,21 +836,24 @@ async def delete_folder(request):
         folder_uuid = request.match_info['folder_uuid']
 
         if folder_uuid not in manager.folders:
-            return web.json_response({"success": False, "error": "Folder not found"}, status=404)
+            return _json_response({"success": False, "error": "Folder not found"}, status=404)
 
         # Remove folder_uuid from any notes that reference it
-        for note in manager.notes.values():
-            if note.folder_uuid == folder_uuid:
-                note.folder_uuid = None
-        manager._save_notes()
+        note_uuids = manager._notes_by_folder.pop(folder_uuid, set())
+        for note_uuid in note_uuids:
+            manager.notes[note_uuid].folder_uuid = None
+        if note_uuids:
+            manager._notes_by_folder.setdefault(None, set()).update(note_uuids)
+            manager._all_notes_cache = None
+            manager._schedule_flush_notes()
 
         # Delete the folder
         del manager.folders[folder_uuid]
         manager._save_folders()
 
-        return web.json_response({"success": True})
+        return _json_response({"success": True})
     except Exception as e:
-        return web.json_response({"error": str(e)}, status=500)
+        return _json_response({"error": str(e)}, status=500)
 
 
 # Node mappings